@@ -1,18 +1,112 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
-import pandas as pd
+from fastapi.responses import Response
+import asyncio
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import numpy as np
+import orjson
 import io
-import matplotlib.pyplot as plt
+import os
+import queue
+import tempfile
+import threading
+import matplotlib
+matplotlib.use("Agg")  # Backend sin interfaz gráfica, sólo para generar imágenes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from regression_model import BasisRegression
 import pickle
 
 app = FastAPI()
 
-# Variables globales para almacenar datos
-X_data, y_observed_data = None, None
 MODEL_PATH = "model.pkl"  # Ruta para guardar el modelo ajustado
 
+# Modelo ajustado en memoria, junto con la fecha de modificación del archivo del que proviene
+CURRENT_MODEL, CURRENT_MODEL_MTIME = None, None
+MODEL_LOCK = threading.Lock()
+
+# Figuras reutilizables para /plot; se crean sin pyplot para no depender de su estado global
+FIGURE_POOL_SIZE = 4
+FIGURE_POOL = queue.Queue()
+for _ in range(FIGURE_POOL_SIZE):
+    _fig = Figure()
+    FigureCanvasAgg(_fig)
+    FIGURE_POOL.put(_fig)
+
+def get_model():
+    """
+    Devuelve el modelo ajustado en memoria, recargándolo desde MODEL_PATH sólo si
+    el archivo cambió (por ejemplo, porque otro worker ajustó un modelo nuevo).
+    """
+    global CURRENT_MODEL, CURRENT_MODEL_MTIME
+    with MODEL_LOCK:
+        mtime = os.path.getmtime(MODEL_PATH)
+        if CURRENT_MODEL is None or mtime != CURRENT_MODEL_MTIME:
+            CURRENT_MODEL = BasisRegression.load_model(MODEL_PATH)
+            CURRENT_MODEL_MTIME = mtime
+        return CURRENT_MODEL
+
+def fit_from_csv(file_bytes, d):
+    """
+    Lee el CSV, optimiza los parámetros, ajusta el modelo y lo guarda.
+    Es trabajo de CPU síncrono, por lo que se ejecuta fuera del event loop.
+    
+    Parámetros:
+    - file_bytes: Contenido del archivo CSV con columnas 't' y 'y_observed'.
+    - d: Grado del B-spline.
+    
+    Retorna:
+    - Diccionario con el mensaje y los parámetros óptimos.
+    """
+    global CURRENT_MODEL, CURRENT_MODEL_MTIME
+
+    # Leer el archivo CSV directamente en una tabla de Arrow, sin pasar por un DataFrame
+    table = pacsv.read_csv(
+        pa.BufferReader(file_bytes),
+        convert_options=pacsv.ConvertOptions(
+            column_types={'t': pa.float64(), 'y_observed': pa.float64()}
+        )
+    )
+    
+    # Verificar que el archivo contenga las columnas necesarias
+    if not {'t', 'y_observed'}.issubset(table.schema.names):
+        raise ValueError("El archivo CSV debe tener columnas 't' y 'y_observed'.")
+
+    # Extraer los datos como arreglos de NumPy
+    X_data = table['t'].to_numpy()
+    y_observed_data = table['y_observed'].to_numpy()
+
+    # Crear el modelo de regresión
+    model = BasisRegression(d=d)
+    
+    # Optimizar los parámetros l y c
+    l_opt, c_opt = model.optimize_parameters(X_data, y_observed_data)
+    
+    # Ajustar el modelo con los parámetros óptimos
+    model.fit(X_data, y_observed_data, l=l_opt, c=c_opt)
+    
+    # Guardar el modelo en un archivo .pkl y mantenerlo en memoria para que /plot no
+    # tenga que volver a cargarlo. Se escribe en un archivo temporal que reemplaza
+    # atómicamente a MODEL_PATH, y todo ocurre bajo el lock para que el modelo en
+    # memoria y su mtime correspondan siempre al archivo en disco
+    with MODEL_LOCK:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(MODEL_PATH)), suffix=".pkl.tmp")
+        os.close(fd)
+        try:
+            model.save_model(tmp_path)
+            os.replace(tmp_path, MODEL_PATH)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        CURRENT_MODEL = model
+        CURRENT_MODEL_MTIME = os.path.getmtime(MODEL_PATH)
+    
+    return {
+        "message": "Modelo ajustado y guardado exitosamente con parámetros óptimos.",
+        "l_opt": float(l_opt),  # orjson no serializa tipos de NumPy
+        "c_opt": int(c_opt)
+    }
+
 @app.post("/fit")
 async def fit_model(file: UploadFile = File(...), d: int = 3):
     """
@@ -23,37 +117,14 @@ async def fit_model(file: UploadFile = File(...), d: int = 3):
     - file: Archivo CSV con columnas 't' y 'y_observed'.
     - d: Grado del B-spline.
     """
-    global X_data, y_observed_data
-
     try:
-        # Leer el archivo CSV en un DataFrame
-        df = pd.read_csv(file.file)
-        
-        # Verificar que el archivo contenga las columnas necesarias
-        if not {'t', 'y_observed'}.issubset(df.columns):
-            raise ValueError("El archivo CSV debe tener columnas 't' y 'y_observed'.")
+        # Leer el archivo de forma asíncrona y ajustar el modelo en un hilo aparte
+        # para no bloquear el event loop (y así /plot sigue respondiendo)
+        file_bytes = await file.read()
+        result = await asyncio.to_thread(fit_from_csv, file_bytes, d)
 
-        # Guardar los datos en variables globales
-        X_data = df['t'].values
-        y_observed_data = df['y_observed'].values
-
-        # Crear el modelo de regresión
-        model = BasisRegression(d=d)
-        
-        # Optimizar los parámetros l y c
-        l_opt, c_opt = model.optimize_parameters(X_data, y_observed_data)
-        
-        # Ajustar el modelo con los parámetros óptimos
-        model.fit(X_data, y_observed_data, l=l_opt, c=c_opt)
-        
-        # Guardar el modelo en un archivo .pkl
-        model.save_model(MODEL_PATH)
-        
-        return {
-            "message": "Modelo ajustado y guardado exitosamente con parámetros óptimos.",
-            "l_opt": l_opt,
-            "c_opt": c_opt
-        }
+        # Serializar la respuesta directamente con orjson
+        return Response(content=orjson.dumps(result), media_type="application/json")
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error al procesar el archivo: {str(e)}")
@@ -64,37 +135,42 @@ def plot():
     Endpoint para generar y devolver la gráfica con el ajuste de regresión.
     Muestra los datos observados y la curva ajustada.
     """
-    global X_data, y_observed_data
-    if X_data is None or y_observed_data is None:
+    # Obtener el modelo ajustado (en memoria o desde el archivo .pkl), que incluye
+    # los datos observados con los que se ajustó
+    try:
+        model = get_model()
+    except FileNotFoundError:
         raise HTTPException(status_code=400, detail="Primero debe cargar los datos observados y ajustar el modelo.")
-
-    # Cargar el modelo desde el archivo .pkl
-    model = BasisRegression.load_model(MODEL_PATH)
+    X_data, y_observed_data = model.X_train_, model.y_train_
 
     # Crear puntos para la predicción en un rango basado en los datos originales
     t_values = np.linspace(min(X_data), max(X_data), 100)
     y_pred = model.predict(t_values)
 
-    # Crear la gráfica
-    fig, ax = plt.subplots()
-    
-    # Graficar los datos observados con ruido
-    ax.scatter(X_data, y_observed_data, color="red", label="Datos Observados")
-    
-    # Graficar la curva ajustada
-    ax.plot(t_values, y_pred, label="Curva de Ajuste", color="blue")
-    
-    # Configuración de la gráfica
-    ax.set_title(f"Ajuste de Regresión con B-Splines (l={model.l:.4f}, c={model.c})")
-    ax.set_xlabel("t")
-    ax.set_ylabel("y")
-    ax.legend()
-
-    # Guardar la imagen en un buffer
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png")
-    buf.seek(0)
-    plt.close(fig)
-
-    # Devolver la imagen como una respuesta de tipo streaming
-    return StreamingResponse(buf, media_type="image/png")
+    # Tomar una figura del pool (espera si todas están en uso) y devolverla limpia al terminar
+    fig = FIGURE_POOL.get()
+    try:
+        # Crear la gráfica
+        ax = fig.add_subplot()
+        
+        # Graficar los datos observados con ruido
+        ax.scatter(X_data, y_observed_data, color="red", label="Datos Observados")
+        
+        # Graficar la curva ajustada
+        ax.plot(t_values, y_pred, label="Curva de Ajuste", color="blue")
+        
+        # Configuración de la gráfica
+        ax.set_title(f"Ajuste de Regresión con B-Splines (l={model.l:.4f}, c={model.c})")
+        ax.set_xlabel("t")
+        ax.set_ylabel("y")
+        ax.legend()
+
+        # Guardar la imagen en un buffer
+        buf = io.BytesIO()
+        fig.canvas.print_png(buf)
+    finally:
+        fig.clear()
+        FIGURE_POOL.put(fig)
+
+    # Devolver los bytes de la imagen directamente, sin la capa de streaming
+    return Response(content=buf.getvalue(), media_type="image/png")
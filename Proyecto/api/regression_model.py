@@ -1,9 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from numba import njit
 from scipy.interpolate import BSpline
-from scipy.linalg import inv
-from scipy.optimize import minimize
+from scipy.linalg import solveh_banded, svd
+from scipy.optimize import minimize_scalar
+from scipy.sparse import csr_array
 import pickle
 
+# Número de puntos a partir del cual la matriz de diseño se evalúa con `_deboor_design`
+NUMBA_MIN_POINTS = 50
+
+# Número de puntos a partir del cual los valores de `c` se evalúan en paralelo en
+# `optimize_parameters`; por debajo, el costo de crear los hilos supera al del cálculo
+PARALLEL_MIN_POINTS = 5000
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _deboor_design(t, knots, d, c):
+    """
+    Evalúa los d+1 B-splines no nulos en cada punto de `t` con la recurrencia
+    de de Boor y devuelve la matriz de diseño en formato CSR.
+    
+    Parámetros:
+    - t: Vector de puntos donde evaluar (float64).
+    - knots: Vector de nodos extendidos (float64).
+    - d: Grado de los B-splines.
+    - c: Número de funciones de base.
+    
+    Retorna:
+    - Tupla (data, indices, indptr) de la matriz dispersa de tamaño (len(t), c).
+    """
+    n = t.shape[0]
+    nnz = d + 1
+    data = np.empty(n * nnz)
+    indices = np.empty(n * nnz, dtype=np.int64)
+    indptr = np.arange(0, n * nnz + 1, nnz)
+    N = np.empty(nnz)
+    left = np.empty(nnz)
+    right = np.empty(nnz)
+
+    for i in range(n):
+        x = t[i]
+
+        # Buscar el intervalo knots[k] <= x < knots[k+1] dentro del intervalo base;
+        # los puntos fuera de él usan el polinomio del intervalo extremo (extrapolación).
+        # Se elige el mismo intervalo que SciPy aunque quede vacío por nodos repetidos
+        if x >= knots[c]:
+            k = c - 1
+        elif x < knots[d]:
+            k = d
+        else:
+            lo, hi = d, c
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if x < knots[mid]:
+                    hi = mid
+                else:
+                    lo = mid
+            k = lo
+
+        # Recurrencia de de Boor para los B-splines B_{k-d}, ..., B_k
+        N[0] = 1.0
+        for j in range(1, d + 1):
+            left[j] = x - knots[k + 1 - j]
+            right[j] = knots[k + j] - x
+            saved = 0.0
+            for r in range(j):
+                # Convención 0/0 := 0 para nodos repetidos
+                denom = right[r + 1] + left[j - r]
+                temp = N[r] / denom if denom != 0.0 else 0.0
+                N[r] = saved + right[r + 1] * temp
+                saved = left[j - r] * temp
+            N[j] = saved
+
+        for j in range(nnz):
+            data[i * nnz + j] = N[j]
+            indices[i * nnz + j] = k - d + j
+
+    return data, indices, indptr
+
 class BasisRegression:
     """
     Clase para realizar regresión usando bases de funciones B-splines.
@@ -17,12 +92,13 @@ class BasisRegression:
         - d: Grado del B-spline (por defecto es 3).
         """
         self.coefficients = None     # Coeficientes del modelo ajustado
-        self.A = None                # Matriz de ajuste utilizada en el modelo
-        self.Sl_matrix = None        # Matriz de suavización
+        self._trace_S = None         # Traza de la matriz de suavización (grados de libertad)
         self.c = None                # Número de funciones de base
         self.l = None                # Parámetro de regularización lambda
         self.d = d                   # Grado del B-spline
         self.knots_ = None           # Nodos (knots) calculados para los B-splines
+        self.X_train_ = None         # Datos de entrada usados en el ajuste
+        self.y_train_ = None         # Datos de salida usados en el ajuste
 
     def knots(self, t, num_knots=None):
         """
@@ -47,9 +123,9 @@ class BasisRegression:
         spacing_start = knots[1] - knots[0]
         spacing_end = knots[-1] - knots[-2]
         extended_knots = np.concatenate((
-            [knots[0] - i * spacing_start for i in range(self.d, 0, -1)],
+            knots[0] - spacing_start * np.arange(self.d, 0, -1),
             knots,
-            [knots[-1] + i * spacing_end for i in range(1, self.d + 1)]
+            knots[-1] + spacing_end * np.arange(1, self.d + 1)
         ))
         return extended_knots
 
@@ -63,10 +139,87 @@ class BasisRegression:
         - degree: Grado de los B-splines.
         
         Retorna:
-        - Matriz de diseño evaluada en los puntos `t`.
+        - Matriz de diseño dispersa (CSR) evaluada en los puntos `t`; cada fila
+          tiene a lo sumo `degree + 1` elementos no nulos.
         """
-        bspline = BSpline(knots, np.eye(len(knots) - degree - 1), degree)
-        return bspline(t)
+        t = np.asarray(t, dtype=np.float64)
+        if len(t) <= NUMBA_MIN_POINTS:
+            return BSpline.design_matrix(t, knots, degree, extrapolate=True)
+
+        # Para más puntos se usa el evaluador compilado con Numba
+        c = len(knots) - degree - 1
+        data, indices, indptr = _deboor_design(t, np.asarray(knots, dtype=np.float64), degree, c)
+        return csr_array((data, indices, indptr), shape=(len(t), c))
+
+    def banded_gram(self, PtP):
+        """
+        Extrae la forma banda superior de la matriz Phi^T Phi.
+        
+        Como cada punto sólo activa d+1 B-splines consecutivos, Phi^T Phi es
+        simétrica con ancho de banda `d` y basta almacenar sus d+1 diagonales
+        superiores en el formato que espera `scipy.linalg.solveh_banded`.
+        
+        Parámetros:
+        - PtP: Matriz Phi^T Phi de tamaño (c, c), densa o dispersa.
+        
+        Retorna:
+        - ab: Arreglo de tamaño (d+1, c) con las diagonales superiores.
+        """
+        c = PtP.shape[0]
+        ab = np.zeros((self.d + 1, c))
+        for k in range(self.d + 1):
+            ab[self.d - k, k:] = PtP.diagonal(k)
+        return ab
+
+    def prepare_basis(self, X, y, c):
+        """
+        Calcula las cantidades del ajuste que sólo dependen de `c` (no de `l`).
+        
+        Parámetros:
+        - X: Vector de datos de entrada (eje x).
+        - y: Vector de datos de salida (eje y).
+        - c: Número de funciones de base.
+        
+        Retorna:
+        - Tupla (knots, Phi, PtP_banded, Pty) con los nodos, la matriz de diseño,
+          la forma banda de Phi^T Phi y el vector Phi^T y.
+        """
+        # Validar que el número de funciones de base `c` sea mayor que el grado `d`
+        if c <= self.d:
+            raise ValueError("El número de funciones de base `c` debe ser mayor que el grado `d`.")
+
+        # Calcular nodos y matriz de diseño
+        knots = self.knots(X, num_knots=c + self.d + 1)
+        Phi = self.build_design_matrix(X, knots, self.d)
+
+        # Phi^T Phi es una matriz banda simétrica (ancho de banda `d`); se
+        # calcula en formato disperso y sólo se extraen sus diagonales
+        PtP_banded = self.banded_gram(Phi.T @ Phi)
+        Pty = Phi.T @ y
+        return knots, Phi, PtP_banded, Pty
+
+    def solve_regularized(self, basis, l):
+        """
+        Resuelve las ecuaciones normales regularizadas a partir de una base ya preparada.
+        
+        Parámetros:
+        - basis: Tupla devuelta por `prepare_basis`.
+        - l: Parámetro de regularización lambda.
+        
+        Almacena:
+        - Los nodos, coeficientes ajustados y traza de la matriz de suavización.
+        """
+        knots, _, PtP_banded, Pty = basis
+        ab = PtP_banded.copy()
+        ab[self.d] += l  # Sumar lambda a la diagonal principal
+        self.knots_ = knots
+        self.coefficients = solveh_banded(ab, Pty)  # Calcular y almacenar los coeficientes
+
+        # Traza de la matriz de suavización S = Phi (Phi^T Phi + l I)^-1 Phi^T sin
+        # productos con Phi: tr(S) = c - l * tr((Phi^T Phi + l I)^-1), que sólo
+        # requiere resolver el sistema banda c x c
+        c = ab.shape[1]
+        self._trace_S = c - l * np.trace(solveh_banded(ab, np.eye(c)))
 
     def fit(self, X, y, l=0, c=None):
         """
@@ -79,26 +232,19 @@ class BasisRegression:
         - c: Número de funciones de base (si no se especifica, se calcula).
         
         Almacena:
-        - Los coeficientes ajustados, nodos y matriz de suavización en los atributos de la clase.
+        - Los coeficientes ajustados, nodos y traza de la matriz de suavización en los atributos de la clase.
+        - Los datos de entrenamiento en `X_train_` y `y_train_`.
         """
         if c is None:
             c = int(len(X) / 4) + 4  # Calcular `c` por defecto en función de los datos
         self.c = c
         self.l = l  # Almacenar el valor de lambda
 
-        # Validar que el número de funciones de base `c` sea mayor que el grado `d`
-        if self.c <= self.d:
-            raise ValueError("El número de funciones de base `c` debe ser mayor que el grado `d`.")
-        
-        # Calcular nodos y matriz de diseño
-        self.knots_ = self.knots(X, num_knots=self.c + self.d + 1)
-        Phi = self.build_design_matrix(X, self.knots_, self.d)
+        basis = self.prepare_basis(X, y, self.c)
+        self.solve_regularized(basis, l)
 
-        # Calcular la matriz de ajuste utilizando regularización
-        lambda_eye = l * np.eye(Phi.shape[1])
-        self.A = inv(Phi.T @ Phi + lambda_eye) @ Phi.T
-        self.Sl_matrix = Phi @ self.A  # Matriz de suavización
-        self.coefficients = self.A @ y  # Calcular y almacenar los coeficientes
+        # Conservar los datos de entrenamiento (los usa /plot para graficar)
+        self.X_train_, self.y_train_ = X, y
 
     def predict(self, x):
         """
@@ -110,7 +256,7 @@ class BasisRegression:
         Retorna:
         - Vector de predicciones.
         """
-        return np.dot(self.coefficients, self.build_design_matrix(x, self.knots_, self.d).T)
+        return self.build_design_matrix(x, self.knots_, self.d) @ self.coefficients
 
     def calculate_gcv(self, X, y):
         """
@@ -128,36 +274,104 @@ class BasisRegression:
         mse = np.mean(residuals**2)  # Error cuadrático medio
 
         # Grados de libertad del modelo (traza de la matriz de suavización)
-        df = np.trace(self.Sl_matrix)
+        df = self._trace_S
         n = len(X)  # Número de muestras
 
         # Calcular el valor de GCV
         gcv_value = mse / (1 - df / n)**2
         return gcv_value
 
-    def optimize_parameters(self, X, y, l_range=(0.0, 1.0), c_range=(5, 15)):
+    def gcv_spectrum(self, X, y, c):
+        """
+        Precalcula la descomposición SVD de la matriz de diseño para un `c` dado,
+        de forma que el GCV pueda evaluarse para cualquier `l` en O(c).
+        
+        Con Phi = U S V^T, la traza de la matriz de suavización es
+        sum(s^2 / (s^2 + l)) y la suma de residuos al cuadrado es
+        ||y||^2 - ||U^T y||^2 + sum((l / (s^2 + l) * U^T y)^2).
+        
+        Parámetros:
+        - X: Vector de datos de entrada (eje x).
+        - y: Vector de datos de salida (eje y).
+        - c: Número de funciones de base.
+        
+        Retorna:
+        - Tupla (S2, UTy, rss_perp) con los valores singulares al cuadrado, la
+          proyección U^T y y la parte de los residuos fuera del espacio de Phi.
+        """
+        if c <= self.d:
+            raise ValueError("El número de funciones de base `c` debe ser mayor que el grado `d`.")
+
+        knots = self.knots(X, num_knots=c + self.d + 1)
+        Phi = self.build_design_matrix(X, knots, self.d)
+        U, S, _ = svd(Phi.toarray(), full_matrices=False)
+        UTy = U.T @ y
+        rss_perp = max(y @ y - UTy @ UTy, 0.0)
+        return S**2, UTy, rss_perp
+
+    def optimize_parameters(self, X, y, l_range=(0.0, 1.0), c_range=(5, 15), n_lambdas=64):
         """
         Encuentra los valores óptimos de l y c minimizando el GCV.
         
+        Recorre los valores enteros de `c` y, para cada uno, evalúa el GCV sobre una
+        malla logarítmica de valores de `l` de forma vectorizada usando la SVD de la
+        matriz de diseño, y refina el mínimo con el método acotado de Brent.
+        
         Parámetros:
         - X: Vector de datos de entrada (eje x).
         - y: Vector de datos de salida (eje y).
         - l_range: Rango de valores posibles para `l` (lambda).
         - c_range: Rango de valores posibles para `c` (número de funciones de base).
+        - n_lambdas: Número de valores de `l` en la malla.
         
         Retorna:
         - l_opt: Valor óptimo de `l`.
         - c_opt: Valor óptimo de `c`.
         """
-        def objective(params):
-            l, c = params
-            self.fit(X, y, l=l, c=int(c))
-            return self.calculate_gcv(X, y)
+        n = len(X)  # Número de muestras
+
+        # Malla de lambdas (la escala logarítmica no admite l = 0)
+        lams = np.geomspace(max(l_range[0], 1e-6), l_range[1], n_lambdas)
+
+        # Sólo son válidos los `c` mayores que el grado `d`
+        cs = list(range(max(int(c_range[0]), self.d + 1), int(c_range[1]) + 1))
+        if not cs:
+            raise ValueError("El número de funciones de base `c` debe ser mayor que el grado `d`.")
+
+        def fit_one_c(c):
+            S2, UTy, rss_perp = self.gcv_spectrum(X, y, c)
+
+            # GCV para toda la malla a la vez: matrices de tamaño (c, n_lambdas)
+            shrink = lams[None, :] / (S2[:, None] + lams[None, :])
+            rss = rss_perp + np.sum((shrink * UTy[:, None])**2, axis=0)
+            df = np.sum(1 - shrink, axis=0)
+            gcv = (rss / n) / (1 - df / n)**2
+
+            def gcv_at(l):
+                shrink = l / (S2 + l)
+                rss = rss_perp + np.sum((shrink * UTy)**2)
+                df = np.sum(1 - shrink)
+                return (rss / n) / (1 - df / n)**2
+
+            # Refinar el mínimo de la malla entre sus dos vecinos con el método acotado de Brent
+            i = np.argmin(gcv)
+            lo = lams[i - 1] if i > 0 else l_range[0]
+            hi = lams[i + 1] if i < n_lambdas - 1 else l_range[1]
+            result = minimize_scalar(gcv_at, bounds=(lo, hi), method='bounded', options={'xatol': 1e-4 * hi})
+            if result.fun < gcv[i]:
+                return result.fun, result.x, c
+            return gcv[i], lams[i], c
+
+        # Cada `c` es independiente; SciPy, NumPy y el evaluador de Numba liberan el GIL,
+        # así que con suficientes datos se reparten entre hilos
+        if n < PARALLEL_MIN_POINTS:
+            results = [fit_one_c(c) for c in cs]
+        else:
+            with ThreadPoolExecutor(max_workers=min(8, len(cs))) as executor:
+                results = list(executor.map(fit_one_c, cs))
 
-        # Usar minimización para encontrar los mejores valores de `l` y `c`
-        result = minimize(objective, x0=[0.1, 10], bounds=[l_range, c_range])
-        l_opt, c_opt = result.x
-        return l_opt, int(c_opt)
+        _, l_opt, c_opt = min(results)
+        return l_opt, c_opt
 
     def save_model(self, filepath):
         """
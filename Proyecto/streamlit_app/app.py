@@ -1,7 +1,5 @@
 import streamlit as st
 import requests
-from PIL import Image
-from io import BytesIO
 
 # URL de la API de FastAPI
 # API_URL = "http://localhost:8000"  # para probar en local
@@ -11,6 +9,12 @@ API_URL = "http://api:8000"  # para consumir la API en el contenedor
 if "active_tab" not in st.session_state:
     st.session_state.active_tab = "Probar la API"
 
+# Sesión HTTP propia de cada usuario, reutilizada entre ejecuciones del script
+# para mantener abierta la conexión con la API
+if "http_session" not in st.session_state:
+    st.session_state.http_session = requests.Session()
+session = st.session_state.http_session
+
 # Crear sistema de pestañas controlado por `session_state`
 tabs = ["Probar la API", "Explicación del Modelo", "Integración de API, Streamlit y Docker"]
 active_tab = st.selectbox("Navega entre las opciones", tabs, index=tabs.index(st.session_state.active_tab))
@@ -24,7 +28,7 @@ if st.session_state.active_tab == "Probar la API":
     uploaded_file = st.file_uploader("Seleccione un archivo CSV con columnas 't' y 'y_observed'", type=["csv"])
     if uploaded_file is not None:
         d = st.slider("Grado del B-spline (d)", 1, 10, 3)
-        response = requests.post(f"{API_URL}/fit", files={"file": uploaded_file}, data={"d": d})
+        response = session.post(f"{API_URL}/fit", files={"file": uploaded_file}, data={"d": d})
 
         if response.status_code == 200:
             st.success("Modelo ajustado exitosamente.")
@@ -35,10 +39,9 @@ if st.session_state.active_tab == "Probar la API":
 
     st.header("Visualización de la curva de Ajuste")
     if st.button("Mostrar Gráfica"):
-        response = requests.get(f"{API_URL}/plot")
+        response = session.get(f"{API_URL}/plot")
         if response.status_code == 200:
-            image = Image.open(BytesIO(response.content))
-            st.image(image, caption="Gráfica del Ajuste de la Regresión", use_container_width=True)
+            st.image(response.content, caption="Gráfica del Ajuste de la Regresión", use_container_width=True)
         else:
             st.error("Error al generar la gráfica.")
 